@@ -1,6 +1,13 @@
+import functools
 import importlib
+import json
 import traceback
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
 
 class RemoteException(Exception):
     """
@@ -13,6 +20,15 @@ class RemoteException(Exception):
         super().__init__(*args)
         self.exception = args[0]
 
+    def __reduce__(self):
+        # The TracebackException may refer to types which only exist here (see FakeException),
+        # so only pickle the already formatted strings, and the rest of our state.
+        strings = self.args[-1]
+        if not isinstance(strings, list):
+            return super().__reduce__()
+        state = {k: v for k, v in vars(self).items() if k != "exception"}
+        return (type(self).FromStrings, (strings,), state)
+
     @classmethod
     def FromTracebackException(cls, tbe):
         # If we provide a single argument which isn't something simple, then it doesn't
@@ -47,7 +63,6 @@ class FakeException(type):
 
 # Methods to serialize / deserialize tracebackexceptions
 
-_traceback_exception_attrs = ["__suppress_context__", "_str"]
 _traceback_exception_syntax_attrs = [
     "filename",
     "lineno",
@@ -59,16 +74,63 @@ _traceback_exception_syntax_attrs = [
 ]
 
 
+def _exception_chain(te, children) -> list:
+    """
+    Return all the nodes in an exception chain, in an order where each node
+    comes after the nodes it refers to.  This is done iteratively, to not
+    recurse on long chains of causes and contexts.
+    """
+    order = []
+    seen = set()
+    # each node is pushed twice: once to expand its children, and once more,
+    # below them, to be emitted after they are done.
+    pending = [(te, False)]
+    while pending:
+        node, expanded = pending.pop()
+        if expanded:
+            order.append(node)
+            continue
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        pending.append((node, True))
+        pending.extend((child, False) for child in children(node) if child and id(child) not in seen)
+    return order
+
+
+def _blank_traceback_exception() -> dict:
+    """
+    Return the attributes of an empty TracebackException.  The set of attributes
+    varies between python versions, so we get them from a real one, once.
+    """
+    try:
+        raise RuntimeError()
+    except RuntimeError as e:
+        result = vars(traceback.TracebackException.from_exception(e))
+    result["stack"] = traceback.StackSummary()
+    return result
+
+
+_blank_traceback_exception_attrs = _blank_traceback_exception()
+
+
 def traceback_exception_serialize(te: traceback.TracebackException) -> dict:
+    serialized = {}
+    for node in _exception_chain(te, lambda n: (n.__cause__, n.__context__)):
+        serialized[id(node)] = _traceback_exception_serialize_node(node, serialized)
+    return serialized[id(te)]
+
+
+def _traceback_exception_serialize_node(te: traceback.TracebackException, serialized: dict) -> dict:
     result = {
         "type": "TracebackException:1.0",
-        "__cause__": traceback_exception_serialize(te.__cause__) if te.__cause__ else None,
-        "__context__": traceback_exception_serialize(te.__context__) if te.__context__ else None,
+        "__cause__": serialized[id(te.__cause__)] if te.__cause__ else None,
+        "__context__": serialized[id(te.__context__)] if te.__context__ else None,
         "stack": stack_summary_serialize(te.stack),
         "exc_type": exc_type_serialize(te.exc_type),
+        "__suppress_context__": te.__suppress_context__,
+        "_str": te._str,
     }
-    for name in _traceback_exception_attrs:
-        result[name] = getattr(te, name)
     if issubclass(te.exc_type, SyntaxError):
         se = {}
         for name in _traceback_exception_syntax_attrs:
@@ -80,22 +142,25 @@ def traceback_exception_serialize(te: traceback.TracebackException) -> dict:
 
 
 def traceback_exception_deserialize(te: dict) -> traceback.TracebackException:
+    deserialized = {}
+    for node in _exception_chain(te, lambda n: (n["__cause__"], n["__context__"])):
+        deserialized[id(node)] = _traceback_exception_deserialize_node(node, deserialized)
+    return deserialized[id(te)]
+
+
+def _traceback_exception_deserialize_node(te: dict, deserialized: dict) -> traceback.TracebackException:
     tbtype = te.get("type", "TracebackException:1.0")
     assert tbtype in ["TracebackException:1.0"]
 
-    # construct a dummy TracebackException and fill its atributes
-    try:
-        raise RuntimeError()
-    except RuntimeError as e:
-        result = traceback.TracebackException.from_exception(e)
-    else:
-        result = None  # to paciy linters
-    result.__cause__ = traceback_exception_deserialize(te["__cause__"]) if te["__cause__"] else None
-    result.__context__ = traceback_exception_deserialize(te["__context__"]) if te["__context__"] else None
+    # construct an empty TracebackException and fill its atributes
+    result = traceback.TracebackException.__new__(traceback.TracebackException)
+    result.__dict__.update(_blank_traceback_exception_attrs)
+    result.__cause__ = deserialized[id(te["__cause__"])] if te["__cause__"] else None
+    result.__context__ = deserialized[id(te["__context__"])] if te["__context__"] else None
     result.stack = stack_summary_deserialize(te["stack"])
     result.exc_type = exc_type_deserialize(te["exc_type"])
-    for name in _traceback_exception_attrs:
-        setattr(result, name, te[name])
+    result.__suppress_context__ = te["__suppress_context__"]
+    result._str = te["_str"]
     if te.get("syntax_error"):
         for name in _traceback_exception_syntax_attrs:
             value = te["syntax_error"].get(name)
@@ -103,27 +168,72 @@ def traceback_exception_deserialize(te: dict) -> traceback.TracebackException:
     return result
 
 
+def traceback_exception_dumps(te: traceback.TracebackException) -> bytes:
+    """
+    Serialize a TracebackException directly to json bytes, using orjson if available.
+    The serialized form only contains strings, small ints, bools, None, lists and dicts,
+    which orjson and the json module handle the same way.
+    """
+    value = traceback_exception_serialize(te)
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value).encode()
+
+
+def traceback_exception_loads(data) -> traceback.TracebackException:
+    if orjson is not None:
+        return traceback_exception_deserialize(orjson.loads(data))
+    return traceback_exception_deserialize(json.loads(data))
+
+
 def exc_type_serialize(exc_type: type) -> dict:
     return {
         "module": exc_type.__module__,
         "name": exc_type.__name__,
-        "repr": repr(exc_type),
+        "repr": _type_repr(exc_type),
     }
 
 
+@functools.lru_cache(maxsize=256)
+def _type_repr(exc_type: type) -> str:
+    return repr(exc_type)
+
+
 def exc_type_deserialize(exc_type: dict):
     """
-    returns either the type (if it exists locally) or a string
+    returns either the type (if it exists locally) or a fake type
     """
+    result = _resolve_exc_type(exc_type["module"], exc_type["name"])
+    if result is _MISSING:
+        return _fake_exc_type(exc_type["module"], exc_type["name"], exc_type["repr"])
+    return result
+
+
+_MISSING = object()
+
+
+@functools.lru_cache(maxsize=1024)
+def _resolve_exc_type(module: str, name: str):
     try:
-        mod = importlib.import_module(exc_type["module"])
-        return getattr(mod, exc_type["name"])
+        mod = importlib.import_module(module)
+        return getattr(mod, name)
     except (ImportError, AttributeError):
-        return FakeException.create(exc_type["module"], exc_type["name"], exc_type["repr"])
+        return _MISSING
+
+
+@functools.lru_cache(maxsize=1024)
+def _fake_exc_type(module: str, name: str, reprstr: str) -> type:
+    return FakeException.create(module, name, reprstr)
 
 
 def stack_summary_serialize(stack_summary: traceback.StackSummary) -> list:
-    return [frame_summary_serialize(frame_summary) for frame_summary in stack_summary]
+    # this is frame_summary_serialize() inlined, to save a call per frame
+    return [
+        [fs.filename, fs.lineno, fs.name, fs.line]
+        if fs.locals is None
+        else [fs.filename, fs.lineno, fs.name, fs.line, fs.locals]
+        for fs in stack_summary
+    ]
 
 
 def stack_summary_deserialize(stack_summary: list) -> traceback.StackSummary:
@@ -132,11 +242,16 @@ def stack_summary_deserialize(stack_summary: list) -> traceback.StackSummary:
 
 
 def frame_summary_serialize(frame_summary: traceback.FrameSummary) -> list:
-    filename, lineno, name, line = tuple(frame_summary)
-    return [filename, lineno, name, line, frame_summary.locals]
+    # locals are only present if the stack was captured with `capture_locals`,
+    # so only emit them when they exist.
+    result = [frame_summary.filename, frame_summary.lineno, frame_summary.name, frame_summary.line]
+    if frame_summary.locals is not None:
+        result.append(frame_summary.locals)
+    return result
 
 
 def frame_summary_deserialize(frame_summary: list) -> traceback.FrameSummary:
-    filename, lineno, name, line, frame_locals = frame_summary
+    filename, lineno, name, line = frame_summary[:4]
+    frame_locals = frame_summary[4] if len(frame_summary) > 4 else None
     fs = traceback.FrameSummary(filename, lineno, name, locals=frame_locals, line=line)
     return fs
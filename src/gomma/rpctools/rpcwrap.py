@@ -8,6 +8,7 @@ exception objects when required.
 
 import functools
 import inspect
+import json
 import traceback
 
 from .exc_tools import (
@@ -26,6 +27,8 @@ def wrap_exception(exception: BaseException, reuse_wrap=True) -> dict:
     is returned instead.  This is useful if an exception from remote is being passed
     on to a different remote.
     """
+    # Reusing the wrap also means that the already sanitized errors are passed straight
+    # through wrapped_result_sanitize(), without building a new TracebackException.
     if reuse_wrap and isinstance(exception, RemoteException):
         if getattr(exception, "wrapped_response", None):
             return exception.wrapped_response
@@ -44,19 +47,23 @@ def wrap_exception(exception: BaseException, reuse_wrap=True) -> dict:
     return result
 
 
-def wrap_result(result):
+def wrap_result(result) -> dict:
     """
     Wrap a result into a standard identifiable object
     """
-    result = {
+    # This is the hot path for successful rpcs.  A dict display with literal keys
+    # is built in a single opcode from a constant key tuple, and the keys are
+    # already interned, so there is nothing to gain from prebuilt keys or templates.
+    # Nor from pooling these dicts: CPython keeps its own freelist of small dicts,
+    # and any python level pool costs more to manage than the allocation it saves.
+    return {
         "_wrapped_response_": "1.0",
         "success": True,
         "result": result,
     }
-    return result
 
 
-def wrapped_result_sanitize(wrapped):
+def wrapped_result_sanitize(wrapped: dict) -> dict:
     """
     Sanitize any errors in the result by converting them to serializable form.
     """
@@ -65,12 +72,25 @@ def wrapped_result_sanitize(wrapped):
     return wrapped
 
 
-def error_sanitize(error):
+def error_sanitize(error: dict) -> dict:
     exc = error.get("exception")
     if exc:
+        if (
+            exc.__traceback__ is None
+            and exc.__cause__ is None
+            and exc.__context__ is None
+            and getattr(exc, "exceptions", None) is None
+        ):
+            # an exception which was never raised has nothing but its message to send.
+            # Exception groups are excluded, since they are rendered with their sub-exceptions.
+            return {
+                "python_traceback_exception": None,
+                "error_strings": traceback.format_exception_only(type(exc), exc),
+            }
         # replace the exception with a serializable form
         tbe = traceback.TracebackException.from_exception(exc)
-        strings = traceback.format_exception(type(exc), exc, exc.__traceback__)
+        # format from the TracebackException rather than walking the traceback a second time
+        strings = list(tbe.format())
         return {
             "python_traceback_exception": traceback_exception_serialize(tbe),
             "error_strings": strings,
@@ -78,11 +98,63 @@ def error_sanitize(error):
     return error
 
 
+class WrappedResponseEncoder(json.JSONEncoder):
+    """
+    A json encoder which sanitizes unsanitized wrapped error responses on demand.
+    This allows handlers to return raw exceptions (see `wrapped_rpc_handler(sanitize=False)`)
+    and defer the cost of traceback serialization until the response is actually encoded
+    for a transport.  Wrapped responses are also found near the top of lists and dicts, such as
+    in a socketio `[event, data]` packet.  The value being encoded is not modified.
+    """
+
+    def iterencode(self, o, _one_shot=False):
+        return super().iterencode(_sanitize_nested(o), _one_shot)
+
+
+def _sanitize_nested(value, depth=2):
+    """
+    Return the value with any unsanitized wrapped error responses within it sanitized.
+    Only the outer `depth` levels of containers are searched, enough for a transport packet
+    such as `[event, {"data": response}]`, and the result of a successful response is
+    never searched, so that large payloads aren't walked in python before encoding.
+    Containers are only copied where something inside them changed.
+    """
+    if isinstance(value, dict):
+        if is_wrapped_response(value):
+            return value if value["success"] else wrapped_result_sanitize(dict(value))
+        items = value.items()
+    elif isinstance(value, (list, tuple)):
+        items = enumerate(value)
+    else:
+        return value
+    if not depth:
+        return value
+    result = value
+    for key, item in items:
+        sanitized = _sanitize_nested(item, depth - 1)
+        if sanitized is not item:
+            if result is value:
+                result = dict(value) if isinstance(value, dict) else list(value)
+            result[key] = sanitized
+    return result
+
+
+def wrapped_response_dumps(wrapped) -> bytes:
+    """
+    Encode a wrapped response as json bytes, sanitizing any unsanitized errors.
+    This always uses the json module, since the result may contain values which
+    other encoders treat differently, such as big ints or nan.
+    """
+    return json.dumps(wrapped, cls=WrappedResponseEncoder).encode()
+
+
 def unwrap_response(value):
     """
     Unwrap a potentially wrapped response and either return the response
     object or raise an error
     """
+    # A single isinstance() check and dict lookup.  We deliberately don't use the slightly
+    # cheaper `type(value) is dict`, since transports may decode into dict subclasses.
     if isinstance(value, dict):
         version = value.get("_wrapped_response_")
         if version is not None:
@@ -96,14 +168,14 @@ def unwrap_response(value):
     return value
 
 
-def is_wrapped_response(value):
+def is_wrapped_response(value) -> bool:
     """
     Returns true if the argument is a wrapped exceptino
     """
     return isinstance(value, dict) and value.get("_wrapped_response_") is not None
 
 
-def wrapped_response_success(value):
+def wrapped_response_success(value: dict) -> bool:
     return value["success"]
 
 
@@ -116,7 +188,7 @@ def raise_from_errors(errors, wrapped_response=None):
     err = errors[0]
     if "exception" in err:
         exception = err["exception"]
-    elif "python_traceback_exception" in err:
+    elif err.get("python_traceback_exception"):
         tbe = traceback_exception_deserialize(err["python_traceback_exception"])
         exception = RemoteException.FromTracebackException(tbe)
     else:
@@ -139,22 +211,35 @@ async def async_wrap_rpc_call(target, *args, **kwargs):
     return unwrap_response(result)
 
 
+def _iscoroutinefunction(func) -> bool:
+    """
+    A cheaper inspect.iscoroutinefunction() for the common case of a plain function,
+    testing the code flags directly.  Other callables, such as partials, are passed on to inspect.
+    """
+    code = getattr(func, "__code__", None)
+    if code is not None:
+        return bool(code.co_flags & inspect.CO_COROUTINE)
+    return inspect.iscoroutinefunction(func)
+
+
 def wrapped_rpc_call(func):
     """
     Decorator which applies the appropriate wrap function to the
     """
-    if inspect.iscoroutinefunction(func):
+    # The wrappers call the target directly rather than going through wrap_rpc_call(),
+    # to save a function call per rpc.
+    if _iscoroutinefunction(func):
 
         # Tecnically we don't need to have "wrapper" async, and await inside, but
         # could just pass the coroutine through.  But then the wrapper won't be marked
         # as a coroutinefunction.  Even functools.wraps() cannot fix that up.
         async def wrapper(*args, **kwargs):
-            return await async_wrap_rpc_call(func, *args, **kwargs)
+            return unwrap_response(await func(*args, **kwargs))
 
     else:
 
         def wrapper(*args, **kwargs):
-            return wrap_rpc_call(func, *args, **kwargs)
+            return unwrap_response(func(*args, **kwargs))
 
     return functools.wraps(func)(wrapper)
 
@@ -163,44 +248,59 @@ def wrapped_rpc_call(func):
 # notice that these handlers do not catch BaseException, and so, if a base exception happens
 # (e.g. a Task is cancelled) the caller cannot be notified of this.
 # A different system must be used if we want to both, notify caller, _and_ re-raise error.
-def wrap_rpc_handler(errorhandler, target, *args, **kwargs):
+# If sanitize is False, errors are returned unsanitized, see wrapped_rpc_handler().
+def wrap_rpc_handler(errorhandler, target, *args, sanitize=True, **kwargs):
     try:
         result = target(*args, **kwargs)
         return wrap_result(result)
     except Exception as e:
-        if errorhandler:
-            errorhandler(e)
-        return wrapped_result_sanitize(wrap_exception(e))
+        return _wrap_handler_exception(errorhandler, e, sanitize)
 
 
-async def async_wrap_rpc_handler(errorhandler, target, *args, **kwargs):
+async def async_wrap_rpc_handler(errorhandler, target, *args, sanitize=True, **kwargs):
     try:
         result = await target(*args, **kwargs)
         return wrap_result(result)
     except Exception as e:
-        if errorhandler:
-            errorhandler(e)
-        return wrapped_result_sanitize(wrap_exception(e))
+        return _wrap_handler_exception(errorhandler, e, sanitize)
+
+
+def _wrap_handler_exception(errorhandler, exception: Exception, sanitize=True) -> dict:
+    if errorhandler:
+        errorhandler(exception)
+    wrapped = wrap_exception(exception)
+    return wrapped_result_sanitize(wrapped) if sanitize else wrapped
 
 
-def wrapped_rpc_handler(errorhandler=None):
+def wrapped_rpc_handler(errorhandler=None, sanitize=True):
     """
-    Decorator which applies the appropriate wrap function to the rpc handler
+    Decorator which applies the appropriate wrap function to the rpc handler.
+    If sanitize is False, errors are returned unsanitized, with the raw exception in them.
+    It is then up to the transport to sanitize them before sending, e.g. by encoding
+    with `WrappedResponseEncoder`.
     """
 
     def helper(func):
-        if inspect.iscoroutinefunction(func):
+        # The wrappers call the target directly rather than going through wrap_rpc_handler(),
+        # to save a function call per rpc.
+        if _iscoroutinefunction(func):
 
             # Tecnically we don't need to have "wrapper" async, and await inside, but
             # could just pass the coroutine through.  But then the wrapper won't be marked
             # as a coroutinefunction.  Even functools.wraps() cannot fix that up.
             async def wrapper(*args, **kwargs):
-                return await async_wrap_rpc_handler(errorhandler, func, *args, **kwargs)
+                try:
+                    return wrap_result(await func(*args, **kwargs))
+                except Exception as e:
+                    return _wrap_handler_exception(errorhandler, e, sanitize)
 
         else:
 
             def wrapper(*args, **kwargs):
-                return wrap_rpc_handler(errorhandler, func, *args, **kwargs)
+                try:
+                    return wrap_result(func(*args, **kwargs))
+                except Exception as e:
+                    return _wrap_handler_exception(errorhandler, e, sanitize)
 
         return functools.wraps(func)(wrapper)
 
@@ -1,5 +1,10 @@
+import json
+import pickle
+import sys
 import traceback
 
+import pytest
+
 from gomma.rpctools import exc_tools
 
 
@@ -34,3 +39,143 @@ def test_dynamic_exception():
     assert exc_type.__qualname__ == "LumberError"
     assert exc_type.__module__ == "lumber"
     assert repr(exc_type()) == "LumberError()"
+
+
+def test_frame_locals():
+    """Test that frame locals are only serialized when captured"""
+
+    try:
+        1 / 0
+    except Exception as err:
+        tbe = traceback.TracebackException.from_exception(err)
+        tbe_locals = traceback.TracebackException.from_exception(err, capture_locals=True)
+
+    serial = exc_tools.traceback_exception_serialize(tbe)
+    assert all(len(frame) == 4 for frame in serial["stack"])
+    assert exc_tools.traceback_exception_deserialize(serial).stack[0].locals is None
+
+    serial = exc_tools.traceback_exception_serialize(tbe_locals)
+    assert all(len(frame) == 5 for frame in serial["stack"])
+    tbe = exc_tools.traceback_exception_deserialize(serial)
+    assert "err" in tbe.stack[0].locals
+
+
+def test_long_chain():
+    """Test that long exception chains don't exhaust the stack"""
+
+    try:
+        1 / 0
+    except Exception as err:
+        tbe = traceback.TracebackException.from_exception(err)
+    node = exc_tools.traceback_exception_serialize(tbe)
+
+    # build the chain in serialized form, since TracebackException itself recurses on older pythons
+    depth = sys.getrecursionlimit() * 2
+    for i in range(depth):
+        node = dict(node, __cause__=node, __context__=None, _str=str(i))
+
+    tbe = exc_tools.traceback_exception_deserialize(node)
+    serial = exc_tools.traceback_exception_serialize(tbe)
+
+    n = 0
+    while serial["__cause__"]:
+        assert serial["_str"] == str(depth - 1 - n)
+        serial = serial["__cause__"]
+        n += 1
+    assert n == depth
+    assert serial["exc_type"]["name"] == "ZeroDivisionError"
+
+
+def test_dynamic_exception_cached():
+    """Test that the same unknown exception type is only created once"""
+
+    exc_type = {"module": "lumber", "name": "LumberError", "repr": "<class 'lumber.LumberError'>"}
+    assert exc_tools.exc_type_deserialize(exc_type) is exc_tools.exc_type_deserialize(dict(exc_type))
+    assert exc_tools.exc_type_deserialize({"module": "builtins", "name": "ValueError", "repr": ""}) is ValueError
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_dumps_loads(monkeypatch, use_orjson):
+    """Test serializing straight to json bytes, with and without orjson"""
+
+    if use_orjson and exc_tools.orjson is None:
+        pytest.skip("orjson not installed")
+    if not use_orjson:
+        monkeypatch.setattr(exc_tools, "orjson", None)
+
+    try:
+        1 / 0
+    except Exception as err:
+        tbe = traceback.TracebackException.from_exception(err)
+
+    data = exc_tools.traceback_exception_dumps(tbe)
+    assert isinstance(data, bytes)
+    assert json.loads(data) == exc_tools.traceback_exception_serialize(tbe)
+    tbe2 = exc_tools.traceback_exception_loads(data)
+    assert tbe2.exc_type is ZeroDivisionError
+    assert list(tbe2.format())[-1] == list(tbe.format())[-1]
+
+
+def test_syntax_error():
+    """Test that syntax error details survive a round trip"""
+
+    try:
+        compile("1 +", "lumber.py", "exec")
+    except SyntaxError as err:
+        tbe = traceback.TracebackException.from_exception(err)
+
+    serial = exc_tools.traceback_exception_serialize(tbe)
+    assert serial["syntax_error"]["filename"] == "lumber.py"
+    tbe2 = exc_tools.traceback_exception_deserialize(serial)
+    assert tbe2.filename == "lumber.py"
+    assert tbe2.lineno == tbe.lineno
+    assert list(tbe2.format_exception_only()) == list(tbe.format_exception_only())
+
+
+def test_pickle_remote_exception():
+    """Test that a RemoteException with an unknown exception type can be pickled"""
+
+    try:
+        1 / 0
+    except Exception as err:
+        tbe = traceback.TracebackException.from_exception(err)
+
+    serial = exc_tools.traceback_exception_serialize(tbe)
+    serial["exc_type"]["module"] = "lumber"
+    tbe = exc_tools.traceback_exception_deserialize(serial)
+    exc = exc_tools.RemoteException.FromTracebackException(tbe)
+    exc.wrapped_response = {"hello": "dolly"}
+    exc.lumber = "jack"
+    if hasattr(exc, "add_note"):
+        exc.add_note("timber!")
+
+    exc2 = pickle.loads(pickle.dumps(exc))
+    assert isinstance(exc2, exc_tools.RemoteException)
+    assert exc2.args == (exc.args[-1],)
+    assert exc2.wrapped_response == {"hello": "dolly"}
+    assert exc2.lumber == "jack"
+    assert getattr(exc2, "__notes__", None) == getattr(exc, "__notes__", None)
+
+
+def test_shared_chain_nodes():
+    """Test that nodes shared between causes and contexts are only visited once"""
+
+    try:
+        1 / 0
+    except Exception as err:
+        tbe = traceback.TracebackException.from_exception(err)
+    node = exc_tools.traceback_exception_serialize(tbe)
+
+    # a chain where each node has the previous one as both cause and context
+    depth = 100
+    for i in range(depth):
+        node = dict(node, __cause__=node, __context__=node, _str=str(i))
+
+    tbe = exc_tools.traceback_exception_deserialize(node)
+    for i in reversed(range(depth)):
+        assert tbe._str == str(i)
+        assert tbe.__cause__ is tbe.__context__
+        tbe = tbe.__cause__
+
+    serial = exc_tools.traceback_exception_serialize(exc_tools.traceback_exception_deserialize(node))
+    assert serial["__cause__"] is serial["__context__"]
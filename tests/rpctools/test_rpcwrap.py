@@ -1,5 +1,11 @@
+import asyncio
+import functools
+import inspect
+import json
+import sys
 import traceback
-from unittest.mock import Mock
+from collections import OrderedDict
+from unittest.mock import Mock, patch
 
 import pytest
 
@@ -136,3 +142,191 @@ def test_rewrap_raise_from_wrapped():
     # we now have an error that we wish to wrap
     wrapped2 = rpcwrap.wrap_exception(excinfo.value)
     assert wrapped2 == wrapped
+
+
+def test_unsanitized_handler_encoder():
+    """
+    Test that an unsanitized handler result is sanitized when json encoded
+    """
+
+    errorhandler = Mock()
+
+    @rpcwrap.wrapped_rpc_handler(errorhandler, sanitize=False)
+    def handler():
+        return problemhandler()
+
+    wrapped = handler()
+    errorhandler.assert_called()
+    assert isinstance(wrapped["errors"][0]["exception"], RuntimeError)
+
+    # in-process, the original exception is raised
+    with pytest.raises(RuntimeError):
+        rpcwrap.unwrap_response(wrapped)
+
+    # across the wire, a RemoteException is raised
+    encoded = json.dumps(wrapped, cls=rpcwrap.WrappedResponseEncoder)
+    assert isinstance(wrapped["errors"][0]["exception"], RuntimeError)
+    with pytest.raises(rpcwrap.RemoteException) as excinfo:
+        rpcwrap.unwrap_response(json.loads(encoded))
+    f = traceback.format_exception(type(excinfo.value), excinfo.value, excinfo.value.__traceback__)
+    assert any("bad timing" in s for s in f)
+
+
+def test_async_decorators():
+    errorhandler = Mock()
+
+    @rpcwrap.wrapped_rpc_handler(errorhandler)
+    async def handler():
+        return problemhandler()
+
+    @rpcwrap.wrapped_rpc_call
+    async def call():
+        return await handler()
+
+    @rpcwrap.wrapped_rpc_call
+    async def call_ok():
+        return await rpcwrap.wrapped_rpc_handler()(asyncio.sleep)(0, "hello")
+
+    assert inspect.iscoroutinefunction(handler)
+    assert inspect.iscoroutinefunction(call)
+
+    # callables without __code__ are detected too
+    async def echo(value):
+        return rpcwrap.wrap_result(value)
+
+    call_partial = rpcwrap.wrapped_rpc_call(functools.partial(echo, "hello"))
+    assert inspect.iscoroutinefunction(call_partial)
+    assert asyncio.run(call_partial()) == "hello"
+    with pytest.raises(rpcwrap.RemoteException):
+        asyncio.run(call())
+    errorhandler.assert_called()
+    assert asyncio.run(call_ok()) == "hello"
+
+
+def test_rewrap_handler():
+    """
+    Test that a handler which lets a remote exception through passes on the original
+    sanitized wrap, rather than sanitizing the RemoteException again
+    """
+
+    wrapped = rpcwrap.wrap_rpc_handler(None, problemhandler)
+
+    @rpcwrap.wrapped_rpc_handler()
+    def handler():
+        return rpcwrap.unwrap_response(wrapped)
+
+    with patch.object(rpcwrap, "error_sanitize", wraps=rpcwrap.error_sanitize) as sanitize:
+        wrapped2 = handler()
+    assert wrapped2 is wrapped
+    for call in sanitize.call_args_list:
+        assert "exception" not in call.args[0]
+
+
+def test_wrapped_response_dumps():
+    wrapped = rpcwrap.wrap_exception(RuntimeError("bad timing"))
+    data = rpcwrap.wrapped_response_dumps(wrapped)
+    assert isinstance(wrapped["errors"][0]["exception"], RuntimeError)
+    with pytest.raises(rpcwrap.RemoteException):
+        rpcwrap.unwrap_response(json.loads(data))
+
+    data = rpcwrap.wrapped_response_dumps(rpcwrap.wrap_result({"hello": "dolly"}))
+    assert rpcwrap.unwrap_response(json.loads(data)) == {"hello": "dolly"}
+
+
+def test_unwrap_dict_subclass():
+    wrapped = OrderedDict(rpcwrap.wrap_result("hello dolly"))
+    assert rpcwrap.is_wrapped_response(wrapped)
+    assert rpcwrap.unwrap_response(wrapped) == "hello dolly"
+
+
+def test_unraised_exception():
+    """
+    Test that an exception without a traceback is sent as strings only
+    """
+    wrapped = rpcwrap.wrapped_result_sanitize(rpcwrap.wrap_exception(RuntimeError("bad timing")))
+    error = wrapped["errors"][0]
+    assert error["python_traceback_exception"] is None
+    assert error["error_strings"] == ["RuntimeError: bad timing\n"]
+
+    with pytest.raises(rpcwrap.RemoteException) as excinfo:
+        rpcwrap.unwrap_response(json.loads(json.dumps(wrapped)))
+    exc = excinfo.value
+    f = traceback.format_exception(type(exc), exc, exc.__traceback__)
+    assert any("bad timing" in s for s in f)
+
+
+def test_unsanitized_handler_encoder_nested():
+    """
+    Test that an unsanitized handler result is sanitized when json encoded inside
+    another structure, such as a socketio packet
+    """
+
+    @rpcwrap.wrapped_rpc_handler(sanitize=False)
+    def handler():
+        return problemhandler()
+
+    wrapped = handler()
+    packet = ["ack", {"data": wrapped}, rpcwrap.wrap_result("hello dolly"), wrapped]
+    encoded = json.dumps(packet, cls=rpcwrap.WrappedResponseEncoder)
+    assert packet[1]["data"] is wrapped
+    assert isinstance(wrapped["errors"][0]["exception"], RuntimeError)
+
+    decoded = json.loads(encoded)
+    assert decoded[0] == "ack"
+    assert rpcwrap.unwrap_response(decoded[2]) == "hello dolly"
+    with pytest.raises(rpcwrap.RemoteException) as excinfo:
+        rpcwrap.unwrap_response(decoded[1]["data"])
+    f = traceback.format_exception(type(excinfo.value), excinfo.value, excinfo.value.__traceback__)
+    assert any("bad timing" in s for s in f)
+    with pytest.raises(rpcwrap.RemoteException):
+        rpcwrap.unwrap_response(decoded[3])
+
+
+def test_encoder_skips_success_result():
+    """
+    Test that the encoder doesn't search the result of a successful response
+    """
+    result = [{"item": [i]} for i in range(10000)]
+    for value in [rpcwrap.wrap_result(result), ["ack", rpcwrap.wrap_result(result)]]:
+        with patch.object(rpcwrap, "_sanitize_nested", wraps=rpcwrap._sanitize_nested) as sanitize:
+            encoded = json.dumps(value, cls=rpcwrap.WrappedResponseEncoder)
+            assert rpcwrap.wrapped_response_dumps(value) == encoded.encode()
+        assert encoded == json.dumps(value)
+        # a handful of calls for the packet, none for the items in the result
+        assert sanitize.call_count < 10
+
+
+def test_wrapped_response_dumps_values():
+    """
+    Test that results are encoded like the json module does, whatever else is installed
+    """
+    for value in [2**70, float("nan"), float("inf")]:
+        wrapped = rpcwrap.wrap_result(value)
+        assert rpcwrap.wrapped_response_dumps(wrapped) == json.dumps(wrapped).encode()
+
+
+@pytest.mark.skipif(sys.version_info < (3, 11), reason="requires exception groups")
+def test_unraised_exception_group():
+    """
+    Test that an exception group without a traceback keeps its sub-exceptions
+    """
+    group = ExceptionGroup("many", [ValueError("lumber"), RuntimeError("bad timing")])  # noqa: F821
+    wrapped = rpcwrap.wrapped_result_sanitize(rpcwrap.wrap_exception(group))
+    error = wrapped["errors"][0]
+    assert error["python_traceback_exception"] is not None
+    strings = "".join(error["error_strings"])
+    assert "lumber" in strings
+    assert "bad timing" in strings
+
+
+def test_wrap_handler_unsanitized():
+    async def async_problemhandler():
+        return problemhandler()
+
+    wrapped = rpcwrap.wrap_rpc_handler(None, problemhandler, sanitize=False)
+    assert isinstance(wrapped["errors"][0]["exception"], RuntimeError)
+    wrapped = asyncio.run(rpcwrap.async_wrap_rpc_handler(None, async_problemhandler, sanitize=False))
+    assert isinstance(wrapped["errors"][0]["exception"], RuntimeError)
+
+    wrapped = asyncio.run(rpcwrap.async_wrap_rpc_handler(None, async_problemhandler))
+    assert "exception" not in wrapped["errors"][0]